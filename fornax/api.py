@@ -1,12 +1,15 @@
 import fornax.select
 import fornax.opt
 import sqlalchemy
+import numpy as np
 import itertools
 import collections
 import json
 import os
 import sys
 import hashlib
+import functools
+import heapq
 
 import typing
 from sqlalchemy import event
@@ -14,6 +17,11 @@ from contextlib import contextmanager
 from sqlalchemy.engine import Engine
 import fornax.model as model
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 # TODO: sqlalchemy database integrity exceptions are not caught by the API
 
 
@@ -28,23 +36,119 @@ def _set_sqlite_pragma(dbapi_connection, connection_record):
     cursor.close()
 
 
+# configure SQLite for bulk inserts, only registered on engines
+# created by Connection so other SQLite engines are left alone
+def _set_sqlite_bulk_pragma(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # write ahead logging with synchronous=NORMAL only syncs at checkpoints
+    # rather than on every commit (in memory databases ignore journal_mode)
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    # page cache size in KiB (256 MiB)
+    cursor.execute("PRAGMA cache_size=-262144")
+    cursor.close()
+
+
+def _sha256_digest(data: bytes) -> int:
+    return int.from_bytes(hashlib.sha256(data).digest(), 'big')
+
+
+def _xxhash_digest(data: bytes) -> int:
+    return xxhash.xxh64_intdigest(data)
+
+
+def _get_digest(name: str) -> typing.Callable[[bytes], int]:
+    """Get the digest function used by `_hash` for non integer items
+
+    :param name: either `sha256` or `xxhash`
+    :type name: str
+    :raises ValueError: Raised if name is not a supported digest
+    :raises ImportError: Raised if name is `xxhash` and the xxhash package
+    is not installed
+    :return: function mapping bytes to an unsigned integer
+    :rtype: typing.Callable[[bytes], int]
+    """
+    if name == 'sha256':
+        return _sha256_digest
+    if name == 'xxhash':
+        if xxhash is None:
+            raise ImportError(
+                'FORNAX_HASH=xxhash requires the xxhash package'
+            )
+        return _xxhash_digest
+    raise ValueError(
+        'FORNAX_HASH must be "sha256" or "xxhash", got "{}"'.format(name)
+    )
+
+
+# the digest is fixed for the lifetime of the process since node ids
+# stored in the database depend on it
+_digest = _get_digest(os.environ.get('FORNAX_HASH', 'sha256'))
+
+
 def _hash(item: str, maxsize=sys.maxsize) -> int:
     """An unsalted hash function with a range between 0 and maxsize
 
-    :param item: string or string like object that is accepted by builtin
-    function `str`
+    :param item: hashable string or string like object that is accepted by
+    builtin function `str`
     :type item: str
     param maxsize: maximum value of returned integer
     :type maxsize: int
     :return: hash between 0 and maxsize
     :rtype: int
     """
+    # integers are their own hash so skip the digest and the cache
     if isinstance(item, int):
         return item % maxsize
-    else:
-        return int(
-            hashlib.sha256(str(item).encode('utf-8')).hexdigest(), 16
-        ) % maxsize
+    return _hash_digest(item, maxsize)
+
+
+@functools.lru_cache(maxsize=2**20, typed=True)
+def _hash_digest(item, maxsize: int) -> int:
+    """Digest the string form of *item* into a range between 0 and maxsize
+
+    Results are memoised since the same ids are hashed repeatedly
+    (once per node and again for every edge and match that references it).
+    """
+    return _digest(str(item).encode('utf-8')) % maxsize
+
+
+def _batch(iterable: typing.Iterable, size: int) -> typing.Generator:
+    """Split an iterable into lists of at most *size* items
+
+    :param iterable: any iterable
+    :type iterable: typing.Iterable
+    :param size: maximum number of items in each list
+    :type size: int
+    :return: yield each list of items
+    :rtype: typing.Generator[list, None, None]
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _bulk_insert(
+    session, table, rows: typing.Iterable[dict], batch_size: int
+):
+    """Insert rows into *table* using one executemany statement per batch
+
+    This bypasses the ORM unit of work so that rows are never held in
+    the session identity map.
+
+    :param session: an open sqlalchemy session
+    :param table: sqlalchemy table to insert into
+    :param rows: iterable of dictionaries mapping column names to values
+    :type rows: typing.Iterable[dict]
+    :param batch_size: maximum number of rows sent in a single statement
+    :type batch_size: int
+    """
+    for chunk in _batch(rows, batch_size):
+        session.execute(table.insert(), chunk)
 
 
 class Connection:
@@ -65,15 +169,40 @@ class Connection:
         with Connection("postgres:://user/0.0.0.0./mydb") as conn:
             graph = fornax.GraphHandle.create(conn)
 
+    Node ids that are not integers are hashed using SHA-256 by default.
+    Setting the environment variable ``FORNAX_HASH=xxhash`` selects the
+    much cheaper xxHash64 (requires the *xxhash* package) instead.
+
+    .. note::
+
+        The hash function determines the ids stored in the database.
+        A database populated using one hash function must always be
+        accessed using the same hash function.
+
+    Graph and query ids are assigned by the database. On PostgreSQL,
+    opening a connection also moves the id sequences past any ids
+    inserted explicitly by older versions of fornax.
+
     :param url: dialect[+driver]://user:password@host/dbname[?key=value..]
     :type url: str
+    :param batch_size: maximum number of nodes, edges or matches sent to the
+    database in a single insert statement, defaults to 10000.
+    Memory used while adding to a graph or query is proportional to
+    *batch_size* rather than to the number of items added.
+    :type batch_size: int, optional
     """
 
     SQLITE_MAX_SIZE = 2**63 - 1
+    BATCH_SIZE = 10000
 
-    def __init__(self, url, **kwargs):
+    def __init__(self, url, batch_size=BATCH_SIZE, **kwargs):
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
         self.url = url
+        self.batch_size = batch_size
         self.engine = sqlalchemy.create_engine(self.url, **kwargs)
+        if self.engine.dialect.name == 'sqlite':
+            event.listen(self.engine, 'connect', _set_sqlite_bulk_pragma)
         self.make_session = sqlalchemy.orm.sessionmaker(bind=self.engine)
         self.maxsize = sys.maxsize
         if self.url.startswith('sqlite'):
@@ -85,6 +214,28 @@ class Connection:
         """
         self.connection = self.engine.connect()
         fornax.model.Base.metadata.create_all(self.connection)
+        if self.engine.dialect.name == 'postgresql':
+            self._sync_sequences()
+
+    def _sync_sequences(self):
+        """Move the graph and query id sequences past the largest
+        existing id.
+
+        Older versions of fornax inserted graph and query ids explicitly
+        without advancing the sequences, so the next id drawn from them
+        could already be taken. The sequences are never moved backwards.
+        """
+        for table, column in (
+            (model.Graph.__tablename__, 'graph_id'),
+            (model.Query.__tablename__, 'query_id')
+        ):
+            # GREATEST ignores the NULL max of an empty table
+            sequence = "pg_get_serial_sequence('{}', '{}')".format(
+                table, column)
+            self.connection.execute(sqlalchemy.text(
+                'SELECT setval({0}, GREATEST(MAX({1}) + 1, nextval({0})), '
+                'false) FROM {2}'.format(sequence, column, table)
+            ))
 
     def close(self):
         """ Close the fornax database connection
@@ -160,11 +311,42 @@ class InvalidMatchError(Exception):
 class NullValue:
     """
     A dummy nul value that will cause an exception when serialised to json
+    or converted to a string (and so when hashed as a node id)
     """
 
     def __init__(self):
         pass
 
+    def __str__(self):
+        raise TypeError(
+            'missing value, all attributes must be the same length'
+        )
+
+
+_NULL = NullValue()
+
+
+def _zip_columns(*columns: typing.Iterable) -> typing.Iterator[tuple]:
+    """Zip columns of attributes into rows
+
+    If every column has a length they must all be equal and are zipped
+    directly. Otherwise the shorter columns are padded with a NullValue
+    which raises an exception once the row is serialised.
+
+    :raises TypeError: Raised if the columns are of different lengths
+    :return: iterator of rows
+    :rtype: typing.Iterator[tuple]
+    """
+    try:
+        lengths = set(len(column) for column in columns)
+    except TypeError:
+        return itertools.zip_longest(*columns, fillvalue=_NULL)
+    if len(lengths) > 1:
+        raise TypeError(
+            'missing value, all attributes must be the same length'
+        )
+    return zip(*columns)
+
 
 class Node:
     """Representation of a Node use internally by QueryHandle
@@ -173,19 +355,31 @@ class Node:
     :type node_id: int
     :param node_type: either `source` or `target`
     :type node_type: str
-    :param meta: meta data to attach to a node to be json serialised
-    :type meta: dict
+    :param meta: meta data to attach to a node to be json serialised,
+    or a json string which is only deserialised when first accessed
+    :type meta: dict or str
     :raises ValueError: Raised is type is not either `source` or `target`
     """
 
-    __slots__ = ['id', 'type', 'meta']
+    __slots__ = ['id', 'type', '_meta']
 
     def __init__(self, node_id: int, node_type: str, meta: dict):
         if node_type not in ('query', 'target'):
             raise ValueError('Nodes must be of type "query", "target"')
         self.id = node_id
         self.type = node_type
-        self.meta = meta
+        self._meta = meta
+
+    @property
+    def meta(self) -> dict:
+        """Get the node meta data
+
+        :return: meta data
+        :rtype: dict
+        """
+        if isinstance(self._meta, str):
+            self._meta = json.loads(self._meta)
+        return self._meta
 
     def __eq__(self, other):
         return (self.id, self.type, self.meta) == (
@@ -208,12 +402,13 @@ class Edge:
     :type end: int
     :param edge_type: either query target or match
     :type edge_type: str
-    :param meta: dictionary of edge metadata to be json serialised
-    :type meta: dict
+    :param meta: dictionary of edge metadata to be json serialised,
+    or a json string which is only deserialised when first accessed
+    :type meta: dict or str
     :param weight: weight between 0 and 1, defaults to 1.
     :raises ValueError: Raised if type is not `query`, `target` or `match`
     """
-    __slots__ = ['start', 'end', 'type', 'meta', 'weight']
+    __slots__ = ['start', 'end', 'type', '_meta', 'weight']
 
     def __init__(
         self, start: int, end: int,
@@ -226,9 +421,20 @@ class Edge:
         self.start = start
         self.end = end
         self.type = edge_type
-        self.meta = meta
+        self._meta = meta
         self.weight = weight
 
+    @property
+    def meta(self) -> dict:
+        """Get the edge meta data
+
+        :return: meta data
+        :rtype: dict
+        """
+        if isinstance(self._meta, str):
+            self._meta = json.loads(self._meta)
+        return self._meta
+
     def __eq__(self, other):
         return (self.type, self.start, self.end, self.meta) == (
             other.type, other.start, other.end, other.meta)
@@ -266,10 +472,11 @@ class GraphHandle:
         :return: node count
         :rtype: int
         """
-        with session_scope() as session:
-            count = session.query(model.Node).filter(
-                model.Node.graph_id == self._graph_id
-            ).count()
+        count = self.conn.session.query(
+            sqlalchemy.func.count()
+        ).select_from(model.Node).filter(
+            model.Node.graph_id == self._graph_id
+        ).scalar()
         return count
 
     def __repr__(self):
@@ -296,16 +503,11 @@ class GraphHandle:
         :rtype: GraphHandle
         """
 
-        query = connection.session.query(
-            sqlalchemy.func.max(model.Graph.graph_id)
-        ).first()
-        graph_id = query[0]
-
-        if graph_id is None:
-            graph_id = 0
-        else:
-            graph_id += 1
-        connection.session.add(model.Graph(graph_id=graph_id))
+        # the database assigns the id, flush to read it back before commit
+        graph = model.Graph()
+        connection.session.add(graph)
+        connection.session.flush()
+        graph_id = graph.graph_id
         connection.session.commit()
         return GraphHandle(connection, graph_id)
 
@@ -333,15 +535,23 @@ class GraphHandle:
         """
 
         self._check_exists()
+        # delete dependent rows explicitly since databases created before
+        # the foreign keys declared ON DELETE CASCADE do not cascade
         self.conn.session.query(
             model.Edge
-        ).filter(model.Edge.graph_id == self._graph_id).delete()
+        ).filter(
+            model.Edge.graph_id == self._graph_id
+        ).delete(synchronize_session=False)
         self.conn.session.query(
             model.Node
-        ).filter(model.Node.graph_id == self._graph_id).delete()
+        ).filter(
+            model.Node.graph_id == self._graph_id
+        ).delete(synchronize_session=False)
         self.conn.session.query(
             model.Graph
-        ).filter(model.Graph.graph_id == self._graph_id).delete()
+        ).filter(
+            model.Graph.graph_id == self._graph_id
+        ).delete(synchronize_session=False)
         self.conn.session.commit()
 
     def _check_exists(self):
@@ -380,7 +590,7 @@ class GraphHandle:
             *id* is a reserved keyword argument which will raise an exception
         """
 
-        keys = kwargs.keys()
+        keys = tuple(kwargs.keys())
 
         if not len(keys):
             raise ValueError(
@@ -390,29 +600,27 @@ class GraphHandle:
         if 'id' in keys:
             raise(ValueError('id is a reserved node attribute \
             which cannot be assigned'))
+        zipped = _zip_columns(*kwargs.values())
         if kwargs.get('id_src') is not None:
-            id_src = kwargs['id_src']
-            zipped = itertools.zip_longest(
-                *kwargs.values(), fillvalue=NullValue()
-            )
-            zipped = itertools.zip_longest(
-                id_src, zipped, fillvalue=NullValue()
-            )
+            # id_src is stored as metadata as well as being the node id
+            id_src = keys.index('id_src')
+            zipped = ((values[id_src], values) for values in zipped)
         else:
-            zipped = enumerate(
-                itertools.zip_longest(*kwargs.values(), fillvalue=NullValue())
-            )
+            zipped = enumerate(zipped)
 
         nodes = (
-            model.Node(
-                node_id=self.conn._hash(node_id),
-                graph_id=self.graph_id,
-                meta=json.dumps({key: val for key, val in zip(keys, values)})
-            )
+            {
+                'node_id': self.conn._hash(node_id),
+                'graph_id': self.graph_id,
+                'meta': json.dumps(dict(zip(keys, values)))
+            }
             for node_id, values in zipped
         )
         nodes = self._check_nodes(nodes)
-        self.conn.session.add_all(nodes)
+        _bulk_insert(
+            self.conn.session, model.Node.__table__, nodes,
+            self.conn.batch_size
+        )
         self.conn.session.commit()
 
     def add_edges(
@@ -449,7 +657,7 @@ class GraphHandle:
 
         """
 
-        keys = kwargs.keys()
+        keys = tuple(kwargs.keys())
         if 'start' in keys:
             raise(
                 ValueError('start is a reserved node attribute \
@@ -463,47 +671,51 @@ class GraphHandle:
         if 'weight' in keys:
             raise(ValueError('weight is a reserved node attribute \
             which cannot be assigned using kwargs'))
-        hashed_sources = map(self.conn._hash, sources)
-        hashed_targets = map(self.conn._hash, targets)
-        zipped = itertools.zip_longest(
-            hashed_sources, hashed_targets,
-            *kwargs.values(), fillvalue=NullValue()
+        zipped = _zip_columns(sources, targets, *kwargs.values())
+        # serialise the metadata once and share it with the reverse edge
+        edges = (
+            (
+                self.conn._hash(start), self.conn._hash(end),
+                json.dumps(dict(zip(keys, values)))
+            )
+            for start, end, *values in zipped
         )
         edges = itertools.chain.from_iterable(
             (
-                model.Edge(
-                    start=start, end=end, graph_id=self._graph_id,
-                    meta=json.dumps(
-                        {key: val for key, val in zip(keys, values)}
-                    )),
-                model.Edge(
-                    start=end, end=start, graph_id=self._graph_id,
-                    meta=json.dumps(
-                        {key: val for key, val in zip(keys, values)}
-                    ))
+                {
+                    'start': start, 'end': end, 'graph_id': self._graph_id,
+                    'meta': meta
+                },
+                {
+                    'start': end, 'end': start, 'graph_id': self._graph_id,
+                    'meta': meta
+                }
             )
-            for start, end, *values in zipped
+            for start, end, meta in edges
         )
         edges = self._check_edges(edges)
-        self.conn.session.add_all(edges)
+        _bulk_insert(
+            self.conn.session, model.Edge.__table__, edges,
+            self.conn.batch_size
+        )
         self.conn.session.commit()
 
     def _check_nodes(self, nodes) -> typing.Generator:
         """Guard against invalid nodes by raising an InvalidNodeError for
         forbidden node parameters
 
-        :param nodes: An iterable of Nodes
-        :type nodes: typing.Iterable[model.Node]
+        :param nodes: An iterable of node rows
+        :type nodes: typing.Iterable[dict]
         :raises InvalidNodeError: Raised when Node.node_id is not an integer
         :raises InvalidNodeError: Raised when Node.node_id is larger than
         MAX_INT
         :return: Yield each node if there are no uncaught exceptions
-        :rtype: typing.Generator[model.Node, None, None]
+        :rtype: typing.Generator[dict, None, None]
         """
 
         for node in nodes:
             try:
-                node_id = int(node.node_id)
+                node_id = int(node['node_id'])
             except ValueError:
                 raise InvalidNodeError(
                     '{}, node_id must be an integer'.format(node)
@@ -513,23 +725,23 @@ class GraphHandle:
             yield node
 
     @staticmethod
-    def _check_edges(edges: typing.Iterable[model.Edge]) -> typing.Generator:
+    def _check_edges(edges: typing.Iterable[dict]) -> typing.Generator:
         """Guard against invalid edges by raising an InvalidEdgeError for
         forbidden edge parameters
 
-        :param edges: An iterable of Edges
-        :type edges: typing.List[model.Edge]
+        :param edges: An iterable of edge rows
+        :type edges: typing.Iterable[dict]
         :raises InvalidEdgeError: Raised if edge start or edge end is
         not an int
         :raises InvalidEdgeError: Raised if edge start and edge end
         are the same
         :return: Yield each edge if there are no uncaught exceptions
-        :rtype: typing.Generator[model.Edge, None, None]
+        :rtype: typing.Generator[dict, None, None]
         """
 
         for edge in edges:
             try:
-                start, end = int(edge.start), int(edge.end)
+                start, end = int(edge['start']), int(edge['end'])
             except ValueError:
                 raise InvalidEdgeError(
                     '{}, edge start and end must be integers'.format(edge)
@@ -556,7 +768,11 @@ class QueryHandle:
     def __init__(self, connection: Connection, query_id: int):
         self.query_id = query_id
         self.conn = connection
-        self._check_exists()
+        self._graph_id_pair = None
+        self._statements = {}
+        self._compiled_cache = {}
+        # reading the graph ids also checks that the query exists
+        self._graph_ids()
 
     def __eq__(self, other):
         return self.query_id == other.query_id
@@ -568,8 +784,11 @@ class QueryHandle:
             {int} -- Count of matching edges
         """
         self._check_exists()
-        count = self.conn.session.query(model.Match).filter(
-            model.Match.query_id == self.query_id).count()
+        count = self.conn.session.query(
+            sqlalchemy.func.count()
+        ).select_from(model.Match).filter(
+            model.Match.query_id == self.query_id
+        ).scalar()
         return count
 
     def _check_exists(self):
@@ -579,9 +798,9 @@ class QueryHandle:
             ValueError -- Raised if the query had been deleted
         """
 
-        exists = self.conn.session.query(model.Query).filter(
+        exists = self.conn.session.query(sqlalchemy.exists().where(
             model.Query.query_id == self.query_id
-        ).scalar()
+        )).scalar()
         if not exists:
             raise ValueError(
                 'cannot read query with query id {}'.format(self.query_id)
@@ -604,19 +823,14 @@ class QueryHandle:
         :rtype: QueryHandle
         """
 
-        query_id = connection.session.query(
-            sqlalchemy.func.max(model.Query.query_id)
-        ).first()[0]
-        if query_id is None:
-            query_id = 0
-        else:
-            query_id += 1
+        # the database assigns the id, flush to read it back before commit
         new_query = model.Query(
-            query_id=query_id,
             start_graph_id=query_graph.graph_id,
             end_graph_id=target_graph.graph_id
         )
         connection.session.add(new_query)
+        connection.session.flush()
+        query_id = new_query.query_id
         connection.session.commit()
         return QueryHandle(connection, query_id)
 
@@ -638,13 +852,39 @@ class QueryHandle:
         """Delete this query and any associated matches
         """
         self._check_exists()
+        # delete matches explicitly since databases created before
+        # the foreign keys declared ON DELETE CASCADE do not cascade
         self.conn.session.query(model.Match).filter(
             model.Match.query_id == self.query_id
-        ).delete()
+        ).delete(synchronize_session=False)
         self.conn.session.query(model.Query).filter(
             model.Query.query_id == self.query_id
-        ).delete()
+        ).delete(synchronize_session=False)
         self.conn.session.commit()
+        self._graph_id_pair = None
+
+    def _graph_ids(self) -> typing.Tuple[int, int]:
+        """Get the ids of the query graph and the target graph.
+
+        The graphs of a query never change so the ids are read from the
+        database once and cached until the query is deleted.
+
+        :raises ValueError: Raised if the query had been deleted
+        :return: query graph id, target graph id
+        :rtype: typing.Tuple[int, int]
+        """
+
+        if self._graph_id_pair is None:
+            row = self.conn.session.query(
+                model.Query.start_graph_id, model.Query.end_graph_id
+            ).filter(model.Query.query_id == self.query_id).first()
+            if row is None:
+                raise ValueError(
+                    'cannot read query with query id {}'.format(
+                        self.query_id)
+                )
+            self._graph_id_pair = tuple(row)
+        return self._graph_id_pair
 
     def query_graph(self) -> GraphHandle:
         """Get a QueryHandle for the query graph
@@ -653,13 +893,7 @@ class QueryHandle:
         :rtype: GraphHandle
         """
 
-        self._check_exists()
-        start_graph = self.conn.session.query(
-            model.Graph
-        ).join(
-            model.Query, model.Graph.graph_id == model.Query.start_graph_id
-        ).filter(model.Query.query_id == self.query_id).first()
-        graph_id = start_graph.graph_id
+        graph_id, _ = self._graph_ids()
         return GraphHandle(self.conn, graph_id)
 
     def target_graph(self) -> GraphHandle:
@@ -669,13 +903,7 @@ class QueryHandle:
         :rtype: GraphHandle
         """
 
-        self._check_exists()
-        end_graph = self.conn.session.query(
-            model.Graph
-        ).join(
-            model.Query, model.Graph.graph_id == model.Query.end_graph_id
-        ).filter(model.Query.query_id == self.query_id).first()
-        graph_id = end_graph.graph_id
+        _, graph_id = self._graph_ids()
         return GraphHandle(self.conn, graph_id)
 
     def add_matches(
@@ -712,8 +940,7 @@ class QueryHandle:
 
         """
 
-        self._check_exists()
-        keys = kwargs.keys()
+        keys = tuple(kwargs.keys())
         if 'start' in keys:
             raise(ValueError('start is a reserved node attribute \
             which cannot be assigned using kwargs'))
@@ -726,65 +953,69 @@ class QueryHandle:
         if 'weight' in keys:
             raise(ValueError('weight is a reserved node attribute \
             which cannot be assigned using kwargs'))
-        hashed_sources = map(self.conn._hash, sources)
-        hashed_targetes = map(self.conn._hash, targets)
-        zipped = itertools.zip_longest(
-            hashed_sources, hashed_targetes, weights,
-            *kwargs.values(), fillvalue=NullValue()
+        zipped = _zip_columns(
+            sources, targets, weights, *kwargs.values()
         )
-        query_graph = self.query_graph()
-        target_graph = self.target_graph()
+        # the graph ids are cached so check the query was not deleted
+        # through another handle before writing to it
+        self._check_exists()
+        # only the graph ids are needed so avoid building GraphHandles
+        # which would check each graph exists
+        start_graph_id, end_graph_id = self._graph_ids()
         matches = (
-            model.Match(
-                start=start,
-                end=end,
-                start_graph_id=query_graph.graph_id,
-                end_graph_id=target_graph.graph_id,
-                query_id=self.query_id,
-                weight=weight,
-                meta=json.dumps({key: val for key, val in zip(keys, values)})
-            )
+            {
+                'start': self.conn._hash(start),
+                'end': self.conn._hash(end),
+                'start_graph_id': start_graph_id,
+                'end_graph_id': end_graph_id,
+                'query_id': self.query_id,
+                'weight': weight,
+                'meta': json.dumps(dict(zip(keys, values)))
+            }
             for start, end, weight, *values in zipped
         )
         matches = self._check_matches(matches)
-        self.conn.session.add_all(matches)
+        _bulk_insert(
+            self.conn.session, model.Match.__table__, matches,
+            self.conn.batch_size
+        )
         self.conn.session.commit()
 
     @staticmethod
     def _check_matches(
-        matches: typing.Iterable[model.Match]
+        matches: typing.Iterable[dict]
     ) -> typing.Generator:
         """Guard against invalid matches by raising an InvalidMatchError
         for forbidden Match parameters
 
-        :param matches: Iterable of Match objects
-        :type matches: typing.Iterable[model.Match]
+        :param matches: Iterable of match rows
+        :type matches: typing.Iterable[dict]
         :raises ValueError: Raised if match start cannot be coorced to
         an integer
         :raises ValueError: Raised if match end cannot be coorced to an integer
         :raises ValueError: Raised if match weight cannot be coorced to a float
         :raises ValueError: Raised if match weight is not in the range 0 to 1
         :return: yield each match
-        :rtype: typing.Generator[model.Match, None, None]
+        :rtype: typing.Generator[dict, None, None]
         """
 
         for match in matches:
             try:
-                start = int(match.start)
+                start = int(match['start'])
             except ValueError:
                 raise ValueError(
                     '<Match(start={}, end={}, weight={})>, \
                     match start must be int'
                 )
             try:
-                end = int(match.end)
+                end = int(match['end'])
             except ValueError:
                 raise ValueError(
                     '<Match(start={}, end={}, weight={})>, \
                     match end must be int'
                 )
             try:
-                weight = float(match.weight)
+                weight = float(match['weight'])
             except ValueError:
                 raise ValueError(
                     '<Match(start={}, end={}, weight={})>,\
@@ -798,42 +1029,50 @@ class QueryHandle:
             yield match
 
     def _query_nodes(self):
-        nodes = self.conn.session.query(model.Node).join(
-            model.Query, model.Node.graph_id == model.Query.start_graph_id
-        ).filter(model.Query.query_id == self.query_id).all()
+        query_graph_id, _ = self._graph_ids()
+        nodes = self.conn.session.query(
+            model.Node.node_id, model.Node.meta
+        ).filter(
+            model.Node.graph_id == query_graph_id
+        ).order_by(model.Node.node_id.asc()).all()
         nodes = [
-            Node(n.node_id, 'query', json.loads(n.meta)) for n in nodes
+            Node(n.node_id, 'query', n.meta) for n in nodes
         ]
         return nodes
 
     def _query_edges(self):
-        edges = self.conn.session.query(model.Edge).join(
-            model.Query, model.Edge.graph_id == model.Query.start_graph_id
+        query_graph_id, _ = self._graph_ids()
+        edges = self.conn.session.query(
+            model.Edge.start, model.Edge.end, model.Edge.meta
         ).filter(
-            model.Query.query_id == self.query_id
+            model.Edge.graph_id == query_graph_id
         ).filter(
             model.Edge.start < model.Edge.end
-        )
+        ).order_by(model.Edge.start.asc(), model.Edge.end.asc())
         edges = [
-            Edge(e.start, e.end, 'query', json.loads(e.meta))
+            Edge(e.start, e.end, 'query', e.meta)
             for e in edges
         ]
         return edges
 
     def _target_nodes(self):
-        nodes = self.conn.session.query(model.Node).join(
-            model.Query, model.Node.graph_id == model.Query.end_graph_id
+        _, target_graph_id = self._graph_ids()
+        # test membership rather than joining so that a target node
+        # matched by several query nodes is only returned once
+        matched = self.conn.session.query(model.Match.end).filter(
+            model.Match.query_id == self.query_id
         ).filter(
-            model.Query.query_id == self.query_id
-        ).join(
-            model.Match, model.Node.node_id == model.Match.end
+            model.Match.end_graph_id == target_graph_id
+        )
+        nodes = self.conn.session.query(
+            model.Node.node_id, model.Node.meta
         ).filter(
-            model.Match.end_graph_id == model.Node.graph_id
+            model.Node.graph_id == target_graph_id
         ).filter(
-            model.Match.query_id == model.Query.query_id
+            model.Node.node_id.in_(matched)
         ).order_by(model.Node.node_id.asc()).all()
         nodes = [
-            Node(n.node_id, 'target', json.loads(n.meta)) for n in nodes
+            Node(n.node_id, 'target', n.meta) for n in nodes
         ]
         return nodes
 
@@ -842,38 +1081,47 @@ class QueryHandle:
         return edge.start in target_ids and edge.end in target_ids
 
     def _target_edges(self, target_nodes, target_edges_arr):
-        # only include target edges that are between the target nodes above
-        EndMatch = sqlalchemy.alias(model.Match, "end_match")
-        StartNode = sqlalchemy.alias(model.Node, "start_node")
-        edges = self.conn.session.query(model.Edge).join(
-            model.Node, model.Edge.start == model.Node.node_id
-        ).join(
-            StartNode, model.Edge.end == StartNode.c.node_id
-        ).join(
-            EndMatch, EndMatch.c.end == model.Node.node_id
-        ).join(
-            model.Query, model.Node.graph_id == model.Query.end_graph_id
+        # only include target edges that are between matched target nodes
+        # both endpoints are tested against the same set in a single query
+        # so no duplicates or dangling edges need to be filtered afterwards
+        matched = self.conn.session.query(model.Match.end).filter(
+            model.Match.query_id == self.query_id
+        )
+        _, target_graph_id = self._graph_ids()
+        edges = self.conn.session.query(
+            model.Edge.start, model.Edge.end, model.Edge.meta
         ).filter(
-            model.Edge.start < model.Edge.end
+            model.Edge.graph_id == target_graph_id
         ).filter(
-            StartNode.c.graph_id == model.Query.end_graph_id
+            model.Edge.start < model.Edge.end
         ).filter(
-            EndMatch.c.end_graph_id == model.Query.end_graph_id
+            model.Edge.start.in_(matched)
         ).filter(
-            model.Edge.graph_id == model.Query.end_graph_id
-        ).order_by(model.Edge.start.asc()).all()
+            model.Edge.end.in_(matched)
+        ).order_by(model.Edge.start.asc(), model.Edge.end.asc()).all()
 
         edges = [
-            Edge(e.start, e.end, 'target', json.loads(e.meta))
+            Edge(e.start, e.end, 'target', e.meta)
             for e in edges
         ]
         return edges
 
     def _optimise(self, hopping_distance, max_iters, offsets, lmbda = 0.3, alpha = 0.3):
-        sql_query = fornax.select.join(
-            self.query_id, h=hopping_distance, offsets=offsets
+        key = (
+            hopping_distance, None if offsets is None else tuple(offsets)
+        )
+        statement = self._statements.get(key)
+        if statement is None:
+            statement = fornax.select.join(
+                self.query_id, h=hopping_distance, offsets=offsets
+            ).statement
+            self._statements[key] = statement
+        # reuse the compiled form of the select every time this query
+        # is executed, within the session's current transaction
+        connection = self.conn.session.connection().execution_options(
+            compiled_cache=self._compiled_cache
         )
-        records = sql_query.with_session(self.conn.session).all()
+        records = connection.execute(statement).fetchall()
 
         packed = fornax.opt.solve(
             records,
@@ -885,15 +1133,32 @@ class QueryHandle:
         inference_costs, subgraphs, iters, sz, target_edges_arr = packed
         return inference_costs, subgraphs, iters, sz, target_edges_arr
 
+    @staticmethod
+    def _pack(subgraphs):
+        """Pack subgraphs into a single (n, 2) array of (v, u) pairs
+        where subgraph i is pairs[indptr[i]:indptr[i + 1]]
+        """
+        lengths = np.fromiter(
+            map(len, subgraphs), dtype=np.int64, count=len(subgraphs))
+        indptr = np.zeros(len(subgraphs) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        pairs = np.fromiter(
+            itertools.chain.from_iterable(
+                itertools.chain.from_iterable(subgraphs)),
+            dtype=np.int64, count=2 * indptr[-1]
+        ).reshape(-1, 2)
+        return indptr, pairs
+
     @classmethod
-    def _get_scores(cls, inference_costs, query_nodes, subgraphs, sz):
-        scores = []
-        for subgraph in subgraphs:
-            score = sum(inference_costs[k] for k in subgraph)
-            score += sz - len(subgraph)
-            score /= len(query_nodes)
-            scores.append(score)
-        return scores
+    def _get_scores(cls, costs, indptr, query_nodes, sz):
+        if len(indptr) < 2:
+            return []
+        # sum each subgraph's slice of the costs in a single reduction
+        lengths = np.diff(indptr)
+        scores = np.add.reduceat(costs, indptr[:-1])
+        scores += sz - lengths
+        scores /= len(query_nodes)
+        return scores.tolist()
 
     def _node_to_dict(self, node: Node) -> dict:
         """Return self as a json serialisable dictionary
@@ -901,16 +1166,21 @@ class QueryHandle:
         :return: dictionary with keys `id`, `type` and `meta`
         :rtype: dict
         """
+        return self._nodes_to_dicts([node])[0]
 
-        return {
+    def _nodes_to_dicts(self, nodes: typing.List[Node]) -> list:
+        """Return each of *nodes* as a json serialisable dictionary
+
+        :return: list of dictionaries with keys `id`, `type` and `meta`
+        :rtype: list
+        """
+        _hash = self.conn._hash
+        return [
             # hash id with type so that the node id is unique to a given
             # submatch result
-            **{
-                'id': self.conn._hash((node.id, node.type)),
-                'type': node.type
-            },
-            **node.meta
-        }
+            {'id': _hash((node.id, node.type)), 'type': node.type, **node.meta}
+            for node in nodes
+        ]
 
     def _edge_to_dict(self, edge: Edge):
         """Return self as a json serialisable dictionary
@@ -918,26 +1188,34 @@ class QueryHandle:
         Returns:
             dict -- dictionart with keys start, end, type, metadata and weight
         """
-        if edge.type == 'query' or edge.type == 'target':
-            # hash start and end with the edge type
-            # to make id unique within a subgraph match
-            start = self.conn._hash((edge.start, edge.type))
-            end = self.conn._hash((edge.end, edge.type))
-
-        elif edge.type == 'match':
-            # hash start and end with the edge type
-            # to make id unique within a subgraph match
-            start = self.conn._hash((edge.start, 'query'))
-            end = self.conn._hash((edge.end, 'target'))
-        return {
-            **{
-                'source': start,
-                'target': end,
-                'type': edge.type,
-                'weight': edge.weight
-            },
-            **edge.meta
+        return self._edges_to_dicts([edge])[0]
+
+    def _edges_to_dicts(self, edges: typing.List[Edge]) -> list:
+        """Return each of *edges* as a json serialisable dictionary
+
+        :return: list of dictionaries with keys source, target, type,
+        weight and metadata
+        :rtype: list
+        """
+        _hash = self.conn._hash
+        # hash start and end with the type of node they refer to
+        # to make ids unique within a subgraph match
+        node_types = {
+            'query': ('query', 'query'),
+            'target': ('target', 'target'),
+            'match': ('query', 'target')
         }
+        dicts = []
+        for edge in edges:
+            start_type, end_type = node_types[edge.type]
+            dicts.append({
+                'source': _hash((edge.start, start_type)),
+                'target': _hash((edge.end, end_type)),
+                'type': edge.type,
+                'weight': edge.weight,
+                **edge.meta
+            })
+        return dicts
 
     def execute(self, n=5, hopping_distance=2, max_iters=10, lmbda = 0.3, alpha = 0.3):
         """Execute a fuzzy subgraph matching query finding the top *n* subgraph
@@ -949,95 +1227,155 @@ class QueryHandle:
         :type hopping_distance: int, optional
         :param max_iters: maximum number of optimisation iterations
         :type max_iters: int, optional
-        :return: query result
+        :return: query result, node and link dictionaries are shared
+        between the result graphs and should not be modified in place
         :rtype: dict
         """
 
         offsets = None  # TODO: implement batching
-        self._check_exists()
+        # len checks that the query exists
         if not len(self):
             raise ValueError('Cannot execute query with no matches')
 
+        # nodes and edges are returned ordered by id by the database
         graphs = []
-        query_nodes = sorted(self._query_nodes())
-        target_nodes = sorted(self._target_nodes())
+        query_nodes = self._query_nodes()
+        target_nodes = self._target_nodes()
         # we will with get target edges from the optimiser
         # since the optimiser knows this anyway
         target_edges = None
-        query_edges = sorted(self._query_edges())
+        query_edges = self._query_edges()
 
         packed = self._optimise(hopping_distance, max_iters, offsets, lmbda = lmbda, alpha = alpha)
         inference_costs, subgraphs, iters, sz, target_edges_arr = packed
-        target_edges = self._target_edges(target_nodes, target_edges_arr)
-        target_edges = sorted(target_edges)
+        result = {
+            'graphs': graphs,
+            'iters': iters,
+            'hopping_distance': hopping_distance,
+            'max_iters': max_iters
+        }
 
-        scores = self._get_scores(inference_costs, query_nodes, subgraphs, sz)
-        # sort graphs by score then deturministicly by hashing
-        idxs = sorted(
-            enumerate(scores),
-            key=lambda x: (x[1], self.conn._hash(tuple(subgraphs[x[0]])))
+        indptr, pairs = self._pack(subgraphs)
+        vs, us = pairs.T.tolist()
+        bounds = list(zip(indptr[:-1].tolist(), indptr[1:].tolist()))
+        # look up the cost of every (v, u) pair of every subgraph once
+        costs = np.fromiter(
+            map(inference_costs.__getitem__, zip(vs, us)),
+            dtype=np.float64, count=len(vs)
         )
 
-        query_nodes_payload = [
-            self._node_to_dict(node)
-            for node in query_nodes
-        ]
+        scores = self._get_scores(costs, indptr, query_nodes, sz)
+        # only graphs scoring no worse than the nth best can be returned
+        # so only those need the hash used to break ties
+        candidates = range(len(scores))
+        if n <= 0:
+            candidates = ()
+        elif n < len(scores):
+            threshold = np.partition(scores, n - 1)[n - 1]
+            candidates = np.flatnonzero(
+                np.asarray(scores) <= threshold).tolist()
+        # sort graphs by score then deturministicly by hashing
+        keys = {}
+        for i in candidates:
+            a, b = bounds[i]
+            subgraph = tuple(zip(vs[a:b], us[a:b]))
+            keys[i] = (scores[i], self.conn._hash(subgraph))
+        # only the best n graphs are returned so avoid sorting them all
+        selected = heapq.nsmallest(n, keys, key=keys.__getitem__)
+        if not selected:
+            return result
 
-        query_edges_payload = [
-            self._edge_to_dict(edge)
-            for edge in query_edges
-        ]
+        target_edges = self._target_edges(target_nodes, target_edges_arr)
 
-        target_nodes_payload = [
-            self._node_to_dict(node)
-            for node in target_nodes
-        ]
+        query_nodes_payload = self._nodes_to_dicts(query_nodes)
+        query_edges_payload = self._edges_to_dicts(query_edges)
 
-        target_edges_payload = [
-            self._edge_to_dict(edge)
-            for edge in target_edges
-        ]
+        # index rendered target nodes by node id, the rendered nodes
+        # and edges are shared by every result graph they appear in
+        target_nodes_by_id = {
+            node.id: payload
+            for node, payload in zip(
+                target_nodes, self._nodes_to_dicts(target_nodes))
+        }
 
-        for i, score in idxs[:min(n, len(idxs))]:
+        # index rendered target edges by start node id, edges arrive
+        # ordered by (start, end) so each bucket is ordered by end
+        target_edges_by_start = {}
+        for edge, payload in zip(
+                target_edges, self._edges_to_dicts(target_edges)):
+            target_edges_by_start.setdefault(edge.start, []).append(
+                (edge.end, payload)
+            )
 
-            _, match_ends = zip(*subgraphs[i])
+        # match sources and targets repeat across the selected graphs
+        # so hash each query and target node id once
+        query_hashes = {
+            node.id: self.conn._hash((node.id, 'query'))
+            for node in query_nodes
+        }
+        target_hashes = {
+            node_id: self.conn._hash((node_id, 'target'))
+            for node_id in target_nodes_by_id
+        }
 
-            matches = [
-                self._edge_to_dict(
-                    Edge(s, e, 'match', {}, 1. - inference_costs[s, e])
+        # the target nodes and edges of each distinct set of matched
+        # target nodes, different subgraphs often match the same set
+        matched_targets = {}
+        # a match link only depends on its pair (v, u)
+        # so graphs sharing a match share its link
+        match_links = {}
+
+        # subgraphs are sorted by (v, u) by the optimiser
+        for i in selected:
+
+            score = scores[i]
+            a, b = bounds[i]
+            starts, ends = vs[a:b], us[a:b]
+            weights = (1. - costs[a:b]).tolist()
+            # several query nodes may match the same target node
+            match_ends = frozenset(ends)
+            targets = matched_targets.get(match_ends)
+            if targets is None:
+                ordered = sorted(match_ends)
+                targets = matched_targets[match_ends] = (
+                    [
+                        target_nodes_by_id[end] for end in ordered
+                        if end in target_nodes_by_id
+                    ],
+                    [
+                        payload
+                        for start in ordered
+                        for end, payload in target_edges_by_start.get(
+                            start, ())
+                        if end in match_ends
+                    ]
                 )
-                for s, e in sorted(subgraphs[i])
-            ]
-
-            match_ends = set(
-                self.conn._hash((i, 'target'))
-                for i in match_ends
-            )
-
+            target_nodes_payload, target_edges_payload = targets
+
+            matches = []
+            for s, e, weight in zip(starts, ends, weights):
+                link = match_links.get((s, e))
+                if link is None:
+                    # same shape as _edge_to_dict for a match edge
+                    # with no metadata
+                    link = match_links[s, e] = {
+                        'source': query_hashes[s],
+                        'target': target_hashes[e],
+                        'type': 'match',
+                        'weight': weight
+                    }
+                matches.append(link)
+
+            # build each list in one allocation
             nxt_graph = {
                 'is_multigraph': False,
                 'cost': score,
-                'nodes': list(query_nodes_payload),  # make a copy
-                'links': matches + list(query_edges_payload)  # make a copy
-            }
-
-            nxt_graph['nodes'].extend([
-                n for n in target_nodes_payload
-                if n['id'] in match_ends
-            ])
-
-            nxt_graph['links'].extend(
-                [
-                    e for e in target_edges_payload
-                    if e['source'] in match_ends and e['target'] in match_ends
+                'nodes': [*query_nodes_payload, *target_nodes_payload],
+                'links': [
+                    *matches, *query_edges_payload, *target_edges_payload
                 ]
-            )
+            }
 
             graphs.append(nxt_graph)
 
-        return {
-            'graphs': graphs,
-            'iters': iters,
-            'hopping_distance': hopping_distance,
-            'max_iters': max_iters
-        }
+        return result
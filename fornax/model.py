@@ -10,7 +10,7 @@ Base = declarative_base()
 class Graph(Base):
     """ A graph containing nodes and edges """
     __tablename__ = 'graph'
-    graph_id = Column(Integer, primary_key=True)
+    graph_id = Column(Integer, primary_key=True, autoincrement=True)
     Index('graph_id')
 
 
@@ -21,7 +21,7 @@ class Query(Base):
         UniqueConstraint('query_id', 'start_graph_id', 'end_graph_id'),
     )
 
-    query_id = Column(Integer, primary_key=True)
+    query_id = Column(Integer, primary_key=True, autoincrement=True)
     start_graph_id = Column(
         Integer, ForeignKey("graph.graph_id"), nullable=False, index=True)
     end_graph_id = Column(
@@ -40,14 +40,14 @@ class Match(Base):
             'query_id', 'start_graph_id', 'end_graph_id', 'start', 'end'),
         ForeignKeyConstraint(
             ['start_graph_id', 'start'], ['node.graph_id', 'node.node_id'],
-            name="fk_match_start"),
+            name="fk_match_start", ondelete='CASCADE'),
         ForeignKeyConstraint(
             ['end_graph_id', 'end'], ['node.graph_id', 'node.node_id'],
-            name="fk_match_end"),
+            name="fk_match_end", ondelete='CASCADE'),
         ForeignKeyConstraint(
             ['query_id', 'start_graph_id', 'end_graph_id'],
             ['query.query_id', 'query.start_graph_id', 'query.end_graph_id'],
-            name="fk_query"
+            name="fk_query", ondelete='CASCADE'
         )
     )
 
@@ -99,7 +99,8 @@ class Node(Base):
         BigInteger,
         CheckConstraint("node_id>=0", name="q_min_id_check")
     )
-    graph_id = Column(Integer, ForeignKey("graph.graph_id"))
+    graph_id = Column(
+        Integer, ForeignKey("graph.graph_id", ondelete='CASCADE'))
     meta = Column(String, nullable=True)
     Index('graph_id')
 
@@ -119,11 +120,13 @@ class Edge(Base):
         PrimaryKeyConstraint('graph_id', 'start', 'end'),
         ForeignKeyConstraint(
             ['graph_id', 'start'],
-            ['node.graph_id', 'node.node_id']
+            ['node.graph_id', 'node.node_id'],
+            ondelete='CASCADE'
         ),
         ForeignKeyConstraint(
             ['graph_id', 'end'],
-            ['node.graph_id', 'node.node_id']
+            ['node.graph_id', 'node.node_id'],
+            ondelete='CASCADE'
         )
     )
 
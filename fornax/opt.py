@@ -629,6 +629,23 @@ def _get_optimal_match(inference_costs: InferenceCost) -> OptimalMatch:
     return group_by_first('v', inference_costs)
 
 
+def _to_dict(inference_costs: InferenceCost) -> dict:
+    """Map each pair (v, u) to its inference cost
+
+    Arguments:
+        inference_costs {InferenceCost} -- inference costs
+
+    Returns:
+        dict -- cost keyed by (v, u)
+    """
+
+    # convert whole columns at once rather than one record at a time
+    return dict(zip(
+        zip(inference_costs.v.tolist(), inference_costs.u.tolist()),
+        inference_costs.cost.tolist()
+    ))
+
+
 def solve(records: List[tuple], max_iters=10, hopping_distance=2, lmbda = 0.3, alpha = 0.3):
     """Generate a set of subgraph matches and costs from a query result
 
@@ -646,11 +663,11 @@ def solve(records: List[tuple], max_iters=10, hopping_distance=2, lmbda = 0.3, a
     # keep a copy for successive iterations
     neighbourhood_matching_costs_cpy = neighbourhood_matching_costs.copy()
 
-    label_costs = {
-        (record.v, record.u): record.weight
-        for record in query_result
-    }
-    label_costs_func = np.vectorize(lambda x: label_costs.get(tuple(x)))
+    # label costs are constant for each pair (v, u) and query_result is
+    # sorted by (v, u) so the first weight in each group is the label cost.
+    # Inference costs are grouped by (v, u) in the same order.
+    _, first = np.unique(query_result[['v', 'u']], return_index=True)
+    label_costs = query_result.weight[first]
 
     while True:
 
@@ -663,14 +680,12 @@ def solve(records: List[tuple], max_iters=10, hopping_distance=2, lmbda = 0.3, a
         partial_inference_costs = _get_partial_inference_costs(
             neighbourhood_matching_costs, beta)
         inference_costs = _get_inference_costs(partial_inference_costs)
-        additional_costs = np.array([label_costs.get(tuple(x)) for x in inference_costs[['v', 'u']]], dtype=np.float32)
-        inference_costs.cost += additional_costs
+        inference_costs.cost += label_costs
 
         # second optimisation
         inference_costs = np.sort(inference_costs, order=['v', 'cost'])
         optimum_match = _get_optimal_match(inference_costs)
-        inference_costs_dict = {
-            (record.v, record.u): record.cost for record in inference_costs}
+        inference_costs_dict = _to_dict(inference_costs)
         apply = np.vectorize(
             lambda x: inference_costs_dict.get(tuple(x), iters))
         neighbourhood_matching_costs = neighbourhood_matching_costs_cpy.copy()
@@ -699,23 +714,25 @@ def solve(records: List[tuple], max_iters=10, hopping_distance=2, lmbda = 0.3, a
 
     # normalise inference costs by the number of iterations
     inference_costs.cost /= iters
-    inference_costs_dict = {
-        (record.v, record.u): record.cost for record in inference_costs}
+    inference_costs_dict = _to_dict(inference_costs)
 
     inference_costs = np.sort(inference_costs, order=['cost'])
-    subgraph_matches = []
+    subgraph_matches, seen = [], set()
     for seed in inference_costs[['v', 'u']]:
         subgraph_match = []
         refine(tuple(seed), subgraph_match)
         subgraph_match = sorted(subgraph_match)
-        if subgraph_match not in subgraph_matches:
+        key = tuple(subgraph_match)
+        if key not in seen:
+            seen.add(key)
             subgraph_matches.append(subgraph_match)
     target_edges = group_by_first(['u', 'uu', 'dist_u'], query_result)[
         ['u', 'uu', 'dist_u']]
-    mask = target_edges['dist_u'] > 0
-    mask *= target_edges['dist_u'] <= 1
-    mask *= target_edges['u'] < target_edges['uu']
-    mask > 0
+    mask = (
+        (target_edges['dist_u'] > 0) &
+        (target_edges['dist_u'] <= 1) &
+        (target_edges['u'] < target_edges['uu'])
+    )
     target_edges = np.sort(target_edges[mask])
     return inference_costs_dict, subgraph_matches, iters, len(
         optimum_match), target_edges
@@ -34,6 +34,9 @@ setup(
         'SQLAlchemy>=1.2.8',
         'numpy>=1.14.5'
     ],
+    extras_require={
+        'xxhash': ['xxhash']
+    },
     author_email='daniel.staff@digicatapult.org.uk',
     long_description=long_description,
     long_description_content_type='text/markdown',
@@ -1,5 +1,10 @@
 import unittest
 import json
+import os
+import tempfile
+import collections
+import sqlalchemy
+import hashlib
 import fornax.api
 import fornax.model
 from test_base import TestCaseDB
@@ -11,6 +16,32 @@ class DummyException(Exception):
     pass
 
 
+class TestHash(TestCase):
+
+    def test_int(self):
+        self.assertEqual(fornax.api._hash(12, 10), 2)
+
+    def test_sha256(self):
+        """the default digest must not change the ids of existing databases
+        """
+        digest = fornax.api._get_digest('sha256')
+        self.assertEqual(
+            digest('a'.encode('utf-8')),
+            int(hashlib.sha256('a'.encode('utf-8')).hexdigest(), 16)
+        )
+
+    @unittest.skipUnless(fornax.api.xxhash, 'xxhash is not installed')
+    def test_xxhash(self):
+        digest = fornax.api._get_digest('xxhash')
+        self.assertEqual(
+            digest('a'.encode('utf-8')),
+            fornax.api.xxhash.xxh64_intdigest('a'.encode('utf-8'))
+        )
+
+    def test_unknown_digest(self):
+        self.assertRaises(ValueError, fornax.api._get_digest, 'md5')
+
+
 class TestConnection(TestCaseDB):
 
     def test_rollback(self):
@@ -37,6 +68,95 @@ class TestConnection(TestCaseDB):
             self.assertEqual(n_graphs, 0)
 
 
+class TestPragma(TestCase):
+
+    def test_bulk_pragma(self):
+        """bulk insert pragmas only apply to engines created by fornax
+        """
+        with fornax.Connection('sqlite://') as conn:
+            synchronous = conn.connection.execute(
+                'PRAGMA synchronous').scalar()
+            self.assertEqual(synchronous, 1)  # NORMAL
+        engine = sqlalchemy.create_engine('sqlite://')
+        with engine.connect() as connection:
+            synchronous = connection.execute('PRAGMA synchronous').scalar()
+            foreign_keys = connection.execute('PRAGMA foreign_keys').scalar()
+        self.assertEqual(synchronous, 2)  # FULL, the SQLite default
+        self.assertEqual(foreign_keys, 1)
+
+
+class TestBatchSize(TestCase):
+
+    def test_batches(self):
+        """inserts larger than the batch size are split across statements
+        """
+        with fornax.Connection('sqlite://', batch_size=2) as conn:
+            statements = []
+            sqlalchemy.event.listen(
+                conn.engine, 'before_cursor_execute',
+                lambda conn, cursor, statement, *args:
+                    statements.append(statement)
+            )
+            graph = fornax.GraphHandle.create(conn)
+            graph.add_nodes(name=['adam', 'ben', 'chris', 'dave', 'eve'])
+            graph.add_edges([0, 1, 2], [1, 2, 3])
+            n_edges = conn.session.query(fornax.model.Edge).count()
+            self.assertEqual(len(graph), 5)
+            self.assertEqual(n_edges, 6)
+        inserts = collections.Counter(
+            statement.split()[2] for statement in statements
+            if statement.startswith('INSERT')
+        )
+        # 5 nodes and 6 edges in batches of 2
+        self.assertEqual(inserts['node'], 3)
+        self.assertEqual(inserts['edge'], 3)
+
+    def test_raises(self):
+        self.assertRaises(
+            ValueError, fornax.Connection, 'sqlite://', batch_size=0)
+
+
+class TestLegacySchema(TestCase):
+    """databases created before the foreign keys declared
+    ON DELETE CASCADE must still support deletes
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = 'sqlite:///' + os.path.join(self.directory.name, 'db')
+        metadata = sqlalchemy.MetaData()
+        for table in fornax.model.Base.metadata.sorted_tables:
+            table.tometadata(metadata)
+        for table in metadata.tables.values():
+            for constraint in table.foreign_key_constraints:
+                constraint.ondelete = None
+        engine = sqlalchemy.create_engine(self.url)
+        metadata.create_all(engine)
+        engine.dispose()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_delete(self):
+        with fornax.Connection(self.url) as conn:
+            query_graph = fornax.GraphHandle.create(conn)
+            query_graph.add_nodes(uid=range(2))
+            query_graph.add_edges([0], [1])
+            target_graph = fornax.GraphHandle.create(conn)
+            target_graph.add_nodes(uid=range(2))
+            target_graph.add_edges([0], [1])
+            query = fornax.QueryHandle.create(
+                conn, query_graph, target_graph)
+            query.add_matches([0, 1], [0, 1], [1, 1])
+            query.delete()
+            query_graph.delete()
+            target_graph.delete()
+            for table in (
+                fornax.model.Match, fornax.model.Edge, fornax.model.Node
+            ):
+                self.assertEqual(conn.session.query(table).count(), 0)
+
+
 class TestGraph(TestCaseDB):
 
     def run(self, result=None):
@@ -53,17 +173,19 @@ class TestGraph(TestCaseDB):
         self.assertRaises(ValueError, fornax.GraphHandle.read, self.conn, 0)
 
     def test_create(self):
-        """first graph has id zero
+        """graph ids are assigned by the database
         """
         graph = fornax.GraphHandle.create(self.conn)
-        self.assertEqual(graph.graph_id, 0)
+        self.assertIsNotNone(graph.graph_id)
+        self.assertEqual(
+            fornax.GraphHandle.read(self.conn, graph.graph_id), graph)
 
     def test_create_two(self):
         """auto increment graph id
         """
-        _ = fornax.GraphHandle.create(self.conn)
+        first = fornax.GraphHandle.create(self.conn)
         second = fornax.GraphHandle.create(self.conn)
-        self.assertEqual(second.graph_id, 1)
+        self.assertEqual(second.graph_id, first.graph_id + 1)
 
     def test_read(self):
         """get a graph handle using graph id
@@ -85,6 +207,26 @@ class TestGraph(TestCaseDB):
         graph.add_edges([0, 2], [1, 1])
         graph.delete()
 
+    def test_delete_cascades(self):
+        """deleting a graph deletes its nodes and edges
+        """
+        graph = fornax.GraphHandle.create(self.conn)
+        graph.add_nodes(id_src=[0, 1, 2])
+        graph.add_edges([0, 2], [1, 1])
+        graph.delete()
+        n_nodes = self.conn.session.query(fornax.model.Node).count()
+        n_edges = self.conn.session.query(fornax.model.Edge).count()
+        self.assertEqual(n_nodes, 0)
+        self.assertEqual(n_edges, 0)
+
+    def test_len(self):
+        """the length of a graph is its node count
+        """
+        graph = fornax.GraphHandle.create(self.conn)
+        self.assertEqual(len(graph), 0)
+        graph.add_nodes(name=['adam', 'ben', 'chris'])
+        self.assertEqual(len(graph), 3)
+
     def test_add_nodes(self):
         """meta data is stored on a node
         """
@@ -92,7 +234,7 @@ class TestGraph(TestCaseDB):
         names = ['adam', 'ben', 'chris']
         graph.add_nodes(name=names)
         nodes = self.conn.session.query(fornax.model.Node).filter(
-            fornax.model.Node.graph_id == 0).all()
+            fornax.model.Node.graph_id == graph.graph_id).all()
         nodes = sorted(nodes, key=lambda node: node.node_id)
         self.assertListEqual(
             names, [json.loads(node.meta)['name'] for node in nodes])
@@ -105,7 +247,7 @@ class TestGraph(TestCaseDB):
         ages = [9, 10, 11]
         graph.add_nodes(name=names, age=ages)
         nodes = self.conn.session.query(fornax.model.Node).filter(
-            fornax.model.Node.graph_id == 0).all()
+            fornax.model.Node.graph_id == graph.graph_id).all()
         nodes = sorted(nodes, key=lambda node: node.node_id)
         self.assertListEqual(
             names, [json.loads(node.meta)['name'] for node in nodes])
@@ -120,6 +262,15 @@ class TestGraph(TestCaseDB):
         ages = [9, 10]
         self.assertRaises(TypeError, graph.add_nodes, name=names, age=ages)
 
+    def test_missing_edge_attribute(self):
+        """Edges with missing endpoints raise before anything is stored
+        """
+        graph = fornax.GraphHandle.create(self.conn)
+        graph.add_nodes(name=['adam', 'ben', 'chris'])
+        self.assertRaises(TypeError, graph.add_edges, [0, 1], [1])
+        self.assertRaises(
+            TypeError, graph.add_edges, iter([0, 1]), iter([1]))
+
     def test_assign_id(self):
         """assigning node id is forbidden
         """
@@ -248,7 +399,9 @@ class TestQuery(TestCaseDB):
         ]
         queries = [fornax.QueryHandle.create(
             self.conn, q, t) for q, t in zip(query_graphs, target_graphs)]
-        self.assertEqual([q.query_id for q in queries], [0, 1, 2])
+        first = queries[0].query_id
+        self.assertEqual(
+            [q.query_id for q in queries], [first, first + 1, first + 2])
 
     def test_create_query_target(self):
         query_graph = fornax.GraphHandle.create(self.conn)
@@ -284,6 +437,26 @@ class TestQuery(TestCaseDB):
         self.assertFalse(query_exists)
         self.assertFalse(matches_exists)
 
+    def test_delete_graphs_raise(self):
+        query_graph = fornax.GraphHandle.create(self.conn)
+        target_graph = fornax.GraphHandle.create(self.conn)
+        query = fornax.QueryHandle.create(self.conn, query_graph, target_graph)
+        query.delete()
+        self.assertRaises(ValueError, query.query_graph)
+        self.assertRaises(ValueError, query.target_graph)
+
+    def test_add_matches_deleted_raises(self):
+        query_graph = fornax.GraphHandle.create(self.conn)
+        target_graph = fornax.GraphHandle.create(self.conn)
+        query_graph.add_nodes(uid=range(2))
+        target_graph.add_nodes(uid=range(2))
+        query = fornax.QueryHandle.create(self.conn, query_graph, target_graph)
+        other = fornax.QueryHandle.read(self.conn, query.query_id)
+        query.delete()
+        self.assertRaises(
+            ValueError, other.add_matches, [0, 1], [0, 1], [1, 1]
+        )
+
     def test_get_query_graph(self):
         query_graph = fornax.GraphHandle.create(self.conn)
         target_graph = fornax.GraphHandle.create(self.conn)
@@ -382,6 +555,92 @@ class TestQuery(TestCaseDB):
             target_edges
         )
 
+    def test_target_nodes_distinct(self):
+        """target nodes matched more than once are only returned once
+        """
+        query_graph = fornax.GraphHandle.create(self.conn)
+        target_graph = fornax.GraphHandle.create(self.conn)
+        query = fornax.QueryHandle.create(self.conn, query_graph, target_graph)
+        query_graph.add_nodes(uid=range(2))
+        query_graph.add_edges([0], [1])
+        target_graph.add_nodes(uid=range(3))
+        target_graph.add_edges([0, 1], [1, 2])
+        query.add_matches([0, 1, 0, 1], [1, 1, 0, 2], [1, 1, 1, 1])
+        self.assertListEqual(
+            [node.id for node in query._target_nodes()],
+            [0, 1, 2]
+        )
+        for graph in query.execute(n=5)['graphs']:
+            ids = [node['id'] for node in graph['nodes']]
+            self.assertEqual(len(ids), len(set(ids)))
+
+    def test_target_edges_distinct(self):
+        """target nodes matched more than once only yield each edge once
+        """
+        query_graph = fornax.GraphHandle.create(self.conn)
+        target_graph = fornax.GraphHandle.create(self.conn)
+        query = fornax.QueryHandle.create(self.conn, query_graph, target_graph)
+        query_graph.add_nodes(uid=range(2))
+        target_graph.add_nodes(uid=range(3))
+        target_graph.add_edges([0, 1], [1, 2])
+        query.add_matches([0, 0, 1, 1], [1, 2, 1, 2], [1, 1, 1, 1])
+        target_edges = query._target_edges(query._target_nodes(), None)
+        self.assertListEqual(
+            [fornax.api.Edge(1, 2, 'target', dict())],
+            target_edges
+        )
+
+    def test_execute_no_graphs(self):
+        query_graph = fornax.GraphHandle.create(self.conn)
+        target_graph = fornax.GraphHandle.create(self.conn)
+        query = fornax.QueryHandle.create(self.conn, query_graph, target_graph)
+        query_graph.add_nodes(uid=range(2))
+        query_graph.add_edges([0], [1])
+        target_graph.add_nodes(uid=range(2))
+        target_graph.add_edges([0], [1])
+        query.add_matches([0, 1], [0, 1], [1, 1])
+        self.assertListEqual(query.execute(n=0)['graphs'], [])
+        self.assertEqual(len(query.execute(n=1)['graphs']), 1)
+
+    def test_to_dicts(self):
+        query_graph = fornax.GraphHandle.create(self.conn)
+        target_graph = fornax.GraphHandle.create(self.conn)
+        query = fornax.QueryHandle.create(self.conn, query_graph, target_graph)
+        query_graph.add_nodes(uid=range(2))
+        query_graph.add_edges([0], [1], label=['a'])
+        nodes, edges = query._query_nodes(), query._query_edges()
+        edges.append(fornax.api.Edge(1, 0, 'match', {}, .5))
+        _hash = self.conn._hash
+        self.assertListEqual(
+            query._nodes_to_dicts(nodes),
+            [
+                {'id': _hash((0, 'query')), 'type': 'query', 'uid': 0},
+                {'id': _hash((1, 'query')), 'type': 'query', 'uid': 1}
+            ]
+        )
+        self.assertListEqual(
+            query._edges_to_dicts(edges),
+            [
+                {
+                    'source': _hash((0, 'query')),
+                    'target': _hash((1, 'query')),
+                    'type': 'query', 'weight': 1., 'label': 'a'
+                },
+                {
+                    'source': _hash((1, 'query')),
+                    'target': _hash((0, 'target')),
+                    'type': 'match', 'weight': .5
+                }
+            ]
+        )
+        self.assertEqual(query._node_to_dict(nodes[0]), {
+            'id': _hash((0, 'query')), 'type': 'query', 'uid': 0
+        })
+        self.assertEqual(query._edge_to_dict(edges[1]), {
+            'source': _hash((1, 'query')), 'target': _hash((0, 'target')),
+            'type': 'match', 'weight': .5
+        })
+
     def test_add_matches(self):
         query_graph = fornax.GraphHandle.create(self.conn)
         target_graph = fornax.GraphHandle.create(self.conn)
@@ -401,6 +660,18 @@ class TestQuery(TestCaseDB):
         self.assertEqual(weights, [m.weight for m in matches])
         self.assertEqual(uids, [json.loads(m.meta)['my_id'] for m in matches])
 
+    def test_len(self):
+        """the length of a query is its match count
+        """
+        query_graph = fornax.GraphHandle.create(self.conn)
+        target_graph = fornax.GraphHandle.create(self.conn)
+        query = fornax.QueryHandle.create(self.conn, query_graph, target_graph)
+        query_graph.add_nodes(uid=range(3))
+        target_graph.add_nodes(uid=range(3))
+        self.assertEqual(len(query), 0)
+        query.add_matches([0, 0], [1, 2], [1, 1])
+        self.assertEqual(len(query), 2)
+
     def test_execute_raises(self):
         query_graph = fornax.GraphHandle.create(self.conn)
         target_graph = fornax.GraphHandle.create(self.conn)
@@ -426,6 +697,11 @@ class TestNode(TestCase):
         self.assertNotEqual(self.node, fornax.api.Node(1, 'query', {'a': 0}))
         self.assertNotEqual(self.node, fornax.api.Node(0, 'target', {'a': 1}))
 
+    def test_meta_json(self):
+        node = fornax.api.Node(0, 'query', '{"a": 1}')
+        self.assertEqual(node.meta, {'a': 1})
+        self.assertEqual(node, self.node)
+
     def test_node_raises(self):
         self.assertRaises(ValueError, fornax.api.Node, 0, 'a', {})
 
@@ -455,6 +731,11 @@ class TestEdge(TestCase):
         self.assertNotEqual(
             self.edge, fornax.api.Edge(0, 1, 'target', {'a': 1}))
 
+    def test_meta_json(self):
+        edge = fornax.api.Edge(0, 1, 'query', '{"a": 1}')
+        self.assertEqual(edge.meta, {'a': 1})
+        self.assertEqual(edge, self.edge)
+
     def test_edge_raises(self):
         self.assertRaises(ValueError, fornax.api.Edge, 0, 1, 'a', {})
 
@@ -518,6 +799,12 @@ class TestExample(TestCaseDB):
     def test_hopping_distance(self):
         self.assertEqual(self.payload['hopping_distance'], 2)
 
+    def test_payload_json_round_trip(self):
+        self.assertEqual(
+            json.loads(json.dumps(self.payload)),
+            self.payload
+        )
+
     def test_first_graph_cost(self):
         graph = self.payload['graphs'][0]
         self.assertEqual(graph['cost'], 0)
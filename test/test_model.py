@@ -10,7 +10,7 @@ class TestNode(TestCaseDB):
         """ node round trip """
         new_graph = model.Graph(graph_id=0)
         self.session.add(new_graph)
-        self.session.commit()
+        self.session.flush()
         new_node = model.Node(node_id=0, graph_id=0)
         self.session.add(new_node)
         self.session.commit()
@@ -25,11 +25,11 @@ class TestEdge(TestCaseDB):
         super().setUp()
         new_graphs = [model.Graph(graph_id=0), model.Graph(graph_id=1)]
         self.session.add_all(new_graphs)
-        self.session.commit()
+        self.session.flush()
         new_nodes = [model.Node(node_id=id_, graph_id=0) for id_ in range(2)]
         new_nodes += [model.Node(node_id=id_, graph_id=1) for id_ in range(2)]
         self.session.add_all(new_nodes)
-        self.session.commit()
+        self.session.flush()
 
         new_edges = [
             model.Edge(start=0, end=1, graph_id=0),
@@ -79,10 +79,10 @@ class TestNeighbours(TestCaseDB):
         super().setUp()
         new_graph = model.Graph(graph_id=0)
         self.session.add(new_graph)
-        self.session.commit()
+        self.session.flush()
         new_nodes = [model.Node(node_id=id_, graph_id=0) for id_ in range(4)]
         self.session.add_all(new_nodes)
-        self.session.commit()
+        self.session.flush()
 
         new_edges = [
             model.Edge(start=0, end=1, graph_id=0),
@@ -118,10 +118,10 @@ class TestMatch(TestCaseDB):
         super().setUp()
         new_graphs = [model.Graph(graph_id=0), model.Graph(graph_id=1)]
         self.session.add_all(new_graphs)
-        self.session.commit()
+        self.session.flush()
         new_query = model.Query(query_id=0, start_graph_id=0, end_graph_id=1)
         self.session.add(new_query)
-        self.session.commit()
+        self.session.flush()
 
         new_nodes = [
             model.Node(node_id=0, graph_id=0),
@@ -130,7 +130,7 @@ class TestMatch(TestCaseDB):
             model.Node(node_id=1, graph_id=1)
         ]
         self.session.add_all(new_nodes)
-        self.session.commit()
+        self.session.flush()
 
         new_edges = [
             model.Match(start=0, end=0, weight=1, start_graph_id=0,